@@ -1,7 +1,7 @@
 """禁言执行模块 - 负责禁言 API 调用和警告消息"""
 
 import asyncio
-from typing import Any, Callable, Dict, List, Optional, Type
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Type
 
 from astrbot.api import logger
 from astrbot.api.event import AstrMessageEvent
@@ -34,7 +34,8 @@ class BanExecutor:
         """统一禁言 API 成功判定口径。"""
         return isinstance(ret, dict) and ret.get('retcode') == 0
 
-    async def ban_user(self, event: AstrMessageEvent, group_id: str, user_id: str, reason: str) -> bool:
+    async def ban_user(self, event: AstrMessageEvent, group_id: str, user_id: str, reason: str,
+                       send_warning: bool = True) -> bool:
         """禁言用户并发送警告消息
 
         Args:
@@ -42,6 +43,7 @@ class BanExecutor:
             group_id: 群组 ID
             user_id: 用户 ID
             reason: 禁言原因
+            send_warning: 是否由本方法单独发送警告（批量处置时由调用方合并发送）
 
         Returns:
             True 表示禁言成功，False 表示失败
@@ -101,7 +103,7 @@ class BanExecutor:
                 logger.info(f"禁言成功: 用户 {user_id}")
 
                 # 发送警告消息
-                if self.get_config("send_warning", True):
+                if send_warning and self.get_config("send_warning", True):
                     await self.send_warning_message(event, group_id, user_id, reason, ban_duration)
 
                 return True
@@ -125,18 +127,7 @@ class BanExecutor:
                                   user_id: str, reason: str, duration: int):
         """发送警告消息到群聊"""
         try:
-            # 获取警告消息模板
-            warning_template = self.get_config(
-                "warning_template",
-                "⚠️ 用户 {user} 因 {reason} 已被禁言 {duration} 秒。请注意文明发言。"
-            )
-
-            # 格式化警告消息
-            warning_message = warning_template.format(
-                user=user_id,
-                reason=reason,
-                duration=duration
-            )
+            warning_message = self._format_warning(user_id, reason, duration)
 
             # 发送消息到群聊
             await event.send(event.plain_result(warning_message))
@@ -146,6 +137,41 @@ class BanExecutor:
         except Exception as e:
             logger.error(f"发送警告消息失败: {e}", exc_info=True)
 
+    async def send_combined_warning(self, event: AstrMessageEvent, group_id: str,
+                                    banned: Sequence[Tuple[str, str]]):
+        """将同一轮处置的多条警告合并为一条群消息发送（每个用户一行）
+
+        Args:
+            banned: [(user_id, reason), ...] 本轮禁言成功的用户
+        """
+        if not banned or not self.get_config("send_warning", True):
+            return
+
+        try:
+            duration = int(self.get_config("ban_duration", 600))
+            warning_message = "\n".join(
+                self._format_warning(user_id, reason, duration) for user_id, reason in banned
+            )
+
+            await event.send(event.plain_result(warning_message))
+
+            logger.info(f"已发送合并警告消息到群 {group_id}（{len(banned)} 个用户）")
+
+        except Exception as e:
+            logger.error(f"发送合并警告消息失败: {e}", exc_info=True)
+
+    def _format_warning(self, user_id: str, reason: str, duration: int) -> str:
+        """按配置模板格式化单个用户的警告文本"""
+        warning_template = self.get_config(
+            "warning_template",
+            "⚠️ 用户 {user} 因 {reason} 已被禁言 {duration} 秒。请注意文明发言。"
+        )
+        return warning_template.format(
+            user=user_id,
+            reason=reason,
+            duration=duration
+        )
+
     def validate_and_should_ban(self, user_id: str,
                                messages_dict: Dict[str, List[Dict]],
                                reason: str) -> bool:
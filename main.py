@@ -8,11 +8,13 @@
 
 import asyncio
 import copy
+import heapq
 import shlex
 import time
 from collections import deque
+from operator import itemgetter
 from pathlib import Path
-from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+from typing import Any, Awaitable, Deque, Dict, FrozenSet, List, Optional, Set, Tuple
 
 from astrbot.api import AstrBotConfig, logger
 from astrbot.api.event import filter, AstrMessageEvent
@@ -26,6 +28,12 @@ from .repositories import SlangRepository, SlangCandidateRepository
 from .services import HybridRetriever, ReviewContextBuilder
 from .models.slang_entry import GLOBAL_SCOPE
 
+# 平台特定类在模块加载时导入一次，缺失时降级为 None（非 QQ 平台环境下插件仍可加载）
+try:
+    from astrbot.core.platform.sources.aiocqhttp.aiocqhttp_message_event import AiocqhttpMessageEvent
+except ImportError:
+    AiocqhttpMessageEvent = None
+
 
 class SpeechCensorshipPlugin(Star):
     """群聊消息审核与自动禁言插件
@@ -73,6 +81,12 @@ class SpeechCensorshipPlugin(Star):
         # 定时检测任务
         self.timer_task: Optional[asyncio.Task] = None
 
+        # 定时检测调度：按群的下一次检测时间组成最小堆 [(due_time, group_id), ...]
+        # 新群开始缓冲时入堆并唤醒定时任务，定时任务只处理到期的群
+        self._check_schedule: List[Tuple[float, str]] = []
+        self._scheduled_groups: Set[str] = set()
+        self._schedule_wake = asyncio.Event()
+
         # 保存最新的 event 对象（用于发送消息和调用 API）
         self.latest_events: Dict[str, AstrMessageEvent] = {}
         self.latest_event_timestamps: Dict[str, float] = {}
@@ -86,6 +100,13 @@ class SpeechCensorshipPlugin(Star):
         self.group_processing_states: Dict[str, str] = {}
         self._processing_states_lock = asyncio.Lock()
 
+        # 触发合并：群组处理中到达的消息只记录"待复查"，不再逐条判断触发条件，
+        # 本轮处理结束后统一复查一次（避免突发流量下重复触发/排队等锁）
+        self._deferred_trigger_groups: Set[str] = set()
+
+        # 后台任务引用（防止任务被 GC，卸载时统一取消）
+        self._background_tasks: Set[asyncio.Task] = set()
+
         # 重试队列：用于存储失败需要重试的群组信息
         # 结构：[(group_id, messages_dict, retry_count, timestamp), ...]
         self.retry_queue: Deque[Tuple[str, Dict[str, List[Dict]], int, float]] = deque()
@@ -94,18 +115,19 @@ class SpeechCensorshipPlugin(Star):
             self._get_config("retry_queue_max_size", self.RETRY_QUEUE_MAX_DEFAULT)
         )
 
-        # 运行时配置缓存（避免高频消息路径中反复构建列表）
-        self._whitelist_user_ids: Set[str] = set()
-        self._enabled_group_ids: Set[str] = set()
+        # 运行时配置缓存（避免高频消息路径中反复查询配置、构建列表）
+        self._whitelist_user_ids: FrozenSet[str] = frozenset()
+        self._enabled_group_ids: FrozenSet[str] = frozenset()
         self._group_filter_enabled = False
+        self._trigger_mode = "hybrid"
+        self._batch_size = 10
+        self._check_interval = 60
+        self._recent_message_limit = 50
 
         # 错误记录（用于 status 命令展示最近错误）
         self.last_errors: Dict[str, Dict[str, Any]] = {}
         self._last_errors_lock = asyncio.Lock()
 
-        # 缓存的导入（用于防止平台耦合）
-        self._aiocqhttp_event_class = None
-
         logger.info("群聊消息审核插件已加载")
 
     def _get_config(self, key: str, default: Any = None) -> Any:
@@ -113,17 +135,10 @@ class SpeechCensorshipPlugin(Star):
         return self.config.get(key, default)
 
     def _try_get_aiocqhttp_event_class(self):
-        """延迟加载平台特定类，避免硬编码耦合"""
-        if self._aiocqhttp_event_class is not None:
-            return self._aiocqhttp_event_class
-
-        try:
-            from astrbot.core.platform.sources.aiocqhttp.aiocqhttp_message_event import AiocqhttpMessageEvent
-            self._aiocqhttp_event_class = AiocqhttpMessageEvent
-            return self._aiocqhttp_event_class
-        except ImportError:
+        """获取平台特定类（模块加载时已导入，不可用时返回 None）"""
+        if AiocqhttpMessageEvent is None:
             logger.warning("无法导入 AiocqhttpMessageEvent，QQ平台特定功能将不可用")
-            return None
+        return AiocqhttpMessageEvent
 
     def _get_data_dir(self) -> Path:
         """获取数据保存目录（使用 AstrBot 的标准数据目录）
@@ -169,6 +184,27 @@ class SpeechCensorshipPlugin(Star):
         async with self._processing_states_lock:
             self.group_processing_states[group_id] = "IDLE"
 
+    def _is_group_processing(self, group_id: str) -> bool:
+        """快速判断群组是否处于 PROCESSING 状态（单线程事件循环内读取无需加锁）"""
+        return self.group_processing_states.get(group_id) == "PROCESSING"
+
+    def _spawn_background_task(self, coro: Awaitable[Any]) -> asyncio.Task:
+        """创建后台任务并保留引用，任务结束后自动移除"""
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return task
+
+    async def _recheck_deferred_trigger(self, group_id: str):
+        """处理结束后复查被合并的触发请求，避免处理期间累积的消息等待下一条消息或下一轮定时任务"""
+        if group_id not in self._deferred_trigger_groups:
+            return
+
+        self._deferred_trigger_groups.discard(group_id)
+        if await self._should_trigger_check(group_id):
+            logger.info(f"群 {group_id} 处理期间累积的消息已达到触发条件，继续检测")
+            self._spawn_background_task(self._process_group_messages(group_id))
+
     async def _enqueue_retry(self, group_id: str, messages_dict: Dict, retry_count: int = 0):
         """将失败的消息加入重试队列
 
@@ -195,14 +231,23 @@ class SpeechCensorshipPlugin(Star):
             logger.info(f"群 {group_id} 消息已加入重试队列（重试次数: {retry_count}/3）")
 
     def _refresh_runtime_config_cache(self):
-        """刷新运行时配置缓存（在初始化和周期任务中调用）。"""
-        whitelist_users = self._get_config("whitelist_users", [])
-        enabled_groups = self._get_config("enabled_groups", [])
+        """刷新运行时配置缓存（在初始化、周期任务和 censor_reload 命令中调用）。"""
+        whitelist_users = self._get_config("whitelist_users", []) or []
+        enabled_groups = self._get_config("enabled_groups", []) or []
 
-        self._whitelist_user_ids = {str(user_id) for user_id in whitelist_users}
-        self._enabled_group_ids = {str(group_id) for group_id in enabled_groups}
+        self._whitelist_user_ids = frozenset(map(str, whitelist_users))
+        self._enabled_group_ids = frozenset(map(str, enabled_groups))
         self._group_filter_enabled = bool(self._enabled_group_ids)
 
+        self._trigger_mode = str(self._get_config("trigger_mode", "hybrid"))
+        self._batch_size = int(self._get_config("batch_size", 10))
+        self._check_interval = max(1, int(self._get_config("check_interval", 60)))
+        self._recent_message_limit = int(self._get_config("recent_message_limit", 50))
+
+    def _get_recent_limit(self) -> int:
+        """当前模式下的最近消息窗口（仅 strict_hybrid 生效，其余模式返回 0 表示不限制）。"""
+        return self._recent_message_limit if self._trigger_mode == "strict_hybrid" else 0
+
     def _is_slang_feature_enabled(self) -> bool:
         """黑话功能总开关。关闭时不拼接任何黑话相关提示词。"""
         return bool(self._get_config("slang_feature_enabled", True))
@@ -259,9 +304,74 @@ class SpeechCensorshipPlugin(Star):
             normalized["confidence"] = round(confidence, 4)
             filtered.append(normalized)
 
-        filtered.sort(key=lambda item: float(item.get("confidence", 0.0)), reverse=True)
+        # confidence 已在上方统一规范化为 float，可直接用 itemgetter 排序
+        filtered.sort(key=itemgetter("confidence"), reverse=True)
         return filtered[: max(1, max_items)]
 
+    async def _execute_bans(self, group_id: str, violations: List[Dict], messages_dict: Dict[str, List[Dict]]):
+        """对通过护栏的违规用户并发执行禁言，并记录成功的违规
+
+        护栏与冷却检查按顺序执行（均为本地操作），禁言 API 调用并发发出，
+        多个违规用户的处置耗时约为一次 API 往返而非 N 次；单个失败不影响其他用户。
+        警告消息在全部禁言完成后合并为一条发送。
+        """
+        targets: List[Tuple[str, str]] = []
+        seen_user_ids: Set[str] = set()
+        for violation in violations:
+            user_id = violation.get("user_id")
+            reason = violation.get("reason", "违规内容")
+
+            if not user_id or user_id in seen_user_ids:
+                continue
+
+            # 应用防误杀护栏
+            if not self.ban_executor.validate_and_should_ban(user_id, messages_dict, reason):
+                continue
+
+            # 检查重复违规冷却
+            if self.violation_manager and await self.violation_manager.check_repeated_violation_async(group_id, user_id):
+                continue
+
+            seen_user_ids.add(user_id)
+            targets.append((user_id, reason))
+
+        if not targets:
+            return
+
+        event = await self._get_latest_event(group_id)
+        if not event:
+            logger.warning(f"无法获取群 {group_id} 的 event 对象，跳过 {len(targets)} 个禁言")
+            return
+
+        results = await asyncio.gather(
+            *(
+                self.ban_executor.ban_user(event, group_id, user_id, reason, send_warning=False)
+                for user_id, reason in targets
+            ),
+            return_exceptions=True,
+        )
+
+        banned: List[Tuple[str, str]] = []
+        records_updated = False
+        for (user_id, reason), result in zip(targets, results):
+            if isinstance(result, Exception):
+                logger.error(f"禁言用户 {user_id} 失败: {result}", exc_info=result)
+                continue
+            if not result:
+                continue
+
+            banned.append((user_id, reason))
+
+            # 记录违规（仅在禁言成功时）
+            if self.violation_manager:
+                await self.violation_manager.record_violation_async(group_id, user_id)
+                records_updated = True
+
+        await self.ban_executor.send_combined_warning(event, group_id, banned)
+
+        if records_updated and self.violation_manager:
+            await self.violation_manager.save_records()
+
     async def _process_retry_queue(self):
         """处理重试队列中的消息
 
@@ -284,9 +394,6 @@ class SpeechCensorshipPlugin(Star):
 
                 # 重新处理这个群组的消息
                 # 为了避免重复进入PROCESSING，我们不再设置处理状态，直接处理
-                trigger_mode = self._get_config("trigger_mode", "hybrid")
-                recent_limit = int(self._get_config("recent_message_limit", 50)) if trigger_mode == "strict_hybrid" else 0
-
                 # 执行LLM分析
                 try:
                     llm_provider = self._get_config("llm_provider", "")
@@ -343,24 +450,7 @@ class SpeechCensorshipPlugin(Star):
                     # 成功：执行禁言逻辑
                     if violations:
                         logger.info(f"重试成功：群 {group_id} 检测到 {len(violations)} 个违规用户")
-
-                        for violation in violations:
-                            user_id = violation.get("user_id")
-                            reason = violation.get("reason", "违规内容")
-
-                            if not user_id or not self.ban_executor.validate_and_should_ban(user_id, messages_dict, reason):
-                                continue
-
-                            if self.violation_manager and await self.violation_manager.check_repeated_violation_async(group_id, user_id):
-                                continue
-
-                            event = await self._get_latest_event(group_id)
-                            if event and await self.ban_executor.ban_user(event, group_id, user_id, reason):
-                                if self.violation_manager:
-                                    await self.violation_manager.record_violation_async(group_id, user_id)
-
-                        if self.violation_manager:
-                            await self.violation_manager.save_records()
+                        await self._execute_bans(group_id, violations, messages_dict)
                     else:
                         logger.info(f"重试成功：群 {group_id} 无违规内容")
 
@@ -376,8 +466,8 @@ class SpeechCensorshipPlugin(Star):
         """插件初始化：加载配置、启动定时任务"""
         self._refresh_runtime_config_cache()
 
-        trigger_mode = self._get_config("trigger_mode", "hybrid")
-        batch_size = self._get_config("batch_size", 10)
+        trigger_mode = self._trigger_mode
+        batch_size = self._batch_size
         llm_provider = self._get_config("llm_provider", "")
 
         # 初始化违规管理器并加载历史记录
@@ -394,8 +484,7 @@ class SpeechCensorshipPlugin(Star):
         # 如果触发模式包含时间触发，启动定时器
         if trigger_mode in ["time_only", "hybrid", "strict_hybrid"]:
             self.timer_task = asyncio.create_task(self._periodic_check())
-            check_interval = self._get_config("check_interval", 60)
-            logger.info(f"定时检测任务已启动（间隔: {check_interval} 秒，模式: {trigger_mode}）")
+            logger.info(f"定时检测任务已启动（间隔: {self._check_interval} 秒，模式: {trigger_mode}）")
 
         logger.info(
             f"当前配置：trigger_mode={trigger_mode}, batch_size={batch_size}, llm_provider={llm_provider or '未配置'}"
@@ -412,11 +501,8 @@ class SpeechCensorshipPlugin(Star):
         llm_provider = self._get_config("llm_provider", "")
         slang_feature_enabled = self._is_slang_feature_enabled()
 
-        total_groups = len(self.message_buffer.buffer)
-        total_messages = sum(
-            sum(len(msgs) for msgs in users.values())
-            for users in self.message_buffer.buffer.values()
-        ) if total_groups > 0 else 0
+        total_groups = self.message_buffer.get_group_count()
+        total_messages = self.message_buffer.get_all_total_messages()
 
         stats = await self.violation_manager.get_stats_async() if self.violation_manager else {}
         slang_stats = await self.slang_repository.get_stats()
@@ -462,6 +548,25 @@ class SpeechCensorshipPlugin(Star):
             f"{recent_error_msg}"
         )
 
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("censor_reload")
+    async def censor_reload(self, event: AstrMessageEvent):
+        """管理员命令：重新加载运行时配置缓存（修改配置后无需等待下一轮定时任务）"""
+        try:
+            self._refresh_runtime_config_cache()
+            yield event.plain_result(
+                "✅ 运行时配置已重新加载\n"
+                f"- trigger_mode: {self._trigger_mode}\n"
+                f"- check_interval: {self._check_interval}\n"
+                f"- batch_size: {self._batch_size}\n"
+                f"- recent_message_limit: {self._recent_message_limit}\n"
+                f"- whitelist_users: {len(self._whitelist_user_ids)}\n"
+                f"- enabled_groups: {len(self._enabled_group_ids) or '全部'}"
+            )
+        except Exception as e:
+            logger.error(f"重新加载配置失败: {e}", exc_info=True)
+            yield event.plain_result(f"❌ 重新加载失败：{e}")
+
     @filter.command("censor_prompt_help")
     async def censor_prompt_help(self, event: AstrMessageEvent):
         """查看自定义提示词和JSON返回格式说明"""
@@ -531,8 +636,7 @@ class SpeechCensorshipPlugin(Star):
             user_name = event.get_sender_name()
 
             # 验证 Event 类型
-            AiocqhttpMessageEvent = self._try_get_aiocqhttp_event_class()
-            if AiocqhttpMessageEvent and not isinstance(event, AiocqhttpMessageEvent):
+            if AiocqhttpMessageEvent is not None and not isinstance(event, AiocqhttpMessageEvent):
                 yield event.plain_result("❌ Event 类型不匹配")
                 return
 
@@ -879,29 +983,29 @@ class SpeechCensorshipPlugin(Star):
             user_id = str(message_obj.sender.user_id) if message_obj.sender else None
             self_id = str(message_obj.self_id) if getattr(message_obj, "self_id", None) else None
             message_str = event.message_str
-            timestamp = message_obj.timestamp
-            user_name = event.get_sender_name()
 
-            if not group_id or not user_id or not message_str.strip():
+            # 廉价判断前置：缺少 ID、空消息、机器人自身消息在任何字典读写之前直接丢弃
+            if not group_id or not user_id or not message_str or not message_str.strip():
                 return
-
-            # 保存最新的 event 对象
-            await self._touch_latest_event(group_id, event)
-
-            # 不缓冲机器人自身消息
             if self_id and user_id == self_id:
                 return
 
-            # 初始化检测时间
-            self.message_buffer.ensure_check_time_initialized(group_id)
+            # 群组过滤（未启用的群不缓存 event、不初始化检测时间）
+            if self._group_filter_enabled and group_id not in self._enabled_group_ids:
+                return
+
+            # 保存最新的 event 对象（白名单用户的 event 同样可用于后续禁言调用）
+            await self._touch_latest_event(group_id, event)
 
             # 白名单检查
             if user_id in self._whitelist_user_ids:
                 return
 
-            # 群组过滤
-            if self._group_filter_enabled and group_id not in self._enabled_group_ids:
-                return
+            # 初始化检测时间
+            self.message_buffer.ensure_check_time_initialized(group_id)
+
+            timestamp = message_obj.timestamp
+            user_name = event.get_sender_name()
 
             lock = await self.message_buffer.get_or_create_lock(group_id)
             async with lock:
@@ -912,20 +1016,24 @@ class SpeechCensorshipPlugin(Star):
                     "user_name": user_name
                 })
 
-                trigger_mode = self._get_config("trigger_mode", "hybrid")
-                if trigger_mode == "strict_hybrid":
-                    recent_limit = int(self._get_config("recent_message_limit", 50))
+                recent_limit = self._get_recent_limit()
+                if recent_limit > 0:
                     self.message_buffer.trim_recent_messages(group_id, recent_limit)
 
                 current_count = self.message_buffer.get_total_messages(group_id)
 
-            batch_size = self._get_config("batch_size", 10)
-            trigger_mode = self._get_config("trigger_mode", "hybrid")
+            # 新开始缓冲的群加入定时检测调度
+            self._schedule_group_check(group_id)
 
             logger.info(
-                f"群 {group_id} 消息累积: {current_count}/{batch_size}（mode={trigger_mode}）"
+                f"群 {group_id} 消息累积: {current_count}/{self._batch_size}（mode={self._trigger_mode}）"
             )
 
+            # 该群正在处理中：合并触发，待本轮结束后统一复查
+            if self._is_group_processing(group_id):
+                self._deferred_trigger_groups.add(group_id)
+                return
+
             # 检查是否需要触发检测
             if await self._should_trigger_check(group_id, current_count):
                 await self._process_group_messages(group_id)
@@ -935,9 +1043,13 @@ class SpeechCensorshipPlugin(Star):
 
     async def _should_trigger_check(self, group_id: str, total_messages: Optional[int] = None) -> bool:
         """判断是否应该触发检测（原子操作：检查+决策在同一把锁内）"""
-        trigger_mode = self._get_config("trigger_mode", "hybrid")
-        check_interval = self._get_config("check_interval", 60)
-        batch_size = self._get_config("batch_size", 10)
+        trigger_mode = self._trigger_mode
+        check_interval = self._check_interval
+        batch_size = self._batch_size
+
+        # 快速路径：缓冲区为空时任何模式都无需检测，不必争用群组锁
+        if self.message_buffer.get_total_messages(group_id) == 0:
+            return False
 
         # 原子性保证：获取计数和判断触发条件在同一把锁内
         lock = await self.message_buffer.get_or_create_lock(group_id)
@@ -970,42 +1082,101 @@ class SpeechCensorshipPlugin(Star):
 
         return False
 
+    def _schedule_group_check(self, group_id: str, due_time: Optional[float] = None):
+        """将群组加入定时检测调度（已在调度中则忽略；未启动定时任务的模式无需调度）"""
+        if self.timer_task is None or group_id in self._scheduled_groups:
+            return
+
+        if due_time is None:
+            due_time = self.message_buffer.get_check_time(group_id) + self._check_interval
+
+        heapq.heappush(self._check_schedule, (due_time, group_id))
+        self._scheduled_groups.add(group_id)
+        self._schedule_wake.set()
+
+    async def _pop_due_groups(self, now: float) -> List[str]:
+        """弹出所有已到期的群组，返回本轮需要检测的群"""
+        groups_to_process: List[str] = []
+
+        while self._check_schedule and self._check_schedule[0][0] <= now:
+            _, group_id = heapq.heappop(self._check_schedule)
+            self._scheduled_groups.discard(group_id)
+
+            # 空群直接出队，下一条消息到来时重新入队
+            total_messages = self.message_buffer.get_total_messages(group_id)
+            if total_messages == 0:
+                continue
+
+            # 期间已被数量条件触发检测过：按最新检测时间顺延
+            due_time = self.message_buffer.get_check_time(group_id) + self._check_interval
+            if due_time > now:
+                self._schedule_group_check(group_id, due_time)
+                continue
+
+            if self._trigger_mode == "time_only":
+                logger.info(f"群 {group_id} 定时触发检测（消息数: {total_messages}）")
+                groups_to_process.append(group_id)
+            elif await self._should_trigger_check(group_id, total_messages):
+                logger.info(f"群 {group_id} 定时轮询触发检测（消息数: {total_messages}）")
+                groups_to_process.append(group_id)
+            else:
+                # 时间已到但其他条件未满足（如 strict_hybrid 数量不足），下个周期再检查
+                self._schedule_group_check(group_id, now + self._check_interval)
+
+        return groups_to_process
+
+    async def _run_periodic_maintenance(self):
+        """周期性维护：刷新配置缓存、处理重试队列、清理过期数据"""
+        self._refresh_runtime_config_cache()
+
+        # 首先处理重试队列（如果有）
+        if self.retry_queue:
+            logger.debug(f"开始处理{len(self.retry_queue)}条重试消息")
+            await self._process_retry_queue()
+
+        # 清理过期消息
+        message_buffer_max_age = int(self._get_config("message_buffer_max_age", 3600))
+        self.message_buffer.cleanup_old_messages(max_age_seconds=message_buffer_max_age)
+
+        # 清理过期违规记录
+        if self.violation_manager:
+            violation_records_expire_days = int(self._get_config("violation_records_expire_days", 7))
+            await self.violation_manager.cleanup_expired_records(max_age_days=violation_records_expire_days)
+
+        # 清理已清空的群组的event缓存（防止内存泄漏）
+        await self._cleanup_stale_events()
+
     async def _periodic_check(self):
-        """定时检测任务（用于包含时间条件的模式）"""
+        """定时检测任务（用于包含时间条件的模式）
+
+        不再每隔 check_interval 轮询全部群组，而是等待最早到期的群或新群入堆唤醒，
+        空闲群不产生任何开销；周期性维护仍按 check_interval 执行。
+        """
+        next_maintenance = time.time() + self._check_interval
         while True:
             try:
-                check_interval = max(1, int(self._get_config("check_interval", 60)))
-                await asyncio.sleep(check_interval)
+                # 先清除唤醒标记再计算等待时间，避免丢失两者之间发生的入堆通知
+                self._schedule_wake.clear()
+                deadline = next_maintenance
+                if self._check_schedule:
+                    deadline = min(deadline, self._check_schedule[0][0])
 
-                logger.debug("执行定时检测...")
-                self._refresh_runtime_config_cache()
+                try:
+                    await asyncio.wait_for(
+                        self._schedule_wake.wait(),
+                        timeout=max(0.0, deadline - time.time()),
+                    )
+                except asyncio.TimeoutError:
+                    pass
 
-                # 首先处理重试队列（如果有）
-                if self.retry_queue:
-                    logger.debug(f"开始处理{len(self.retry_queue)}条重试消息")
-                    await self._process_retry_queue()
+                now = time.time()
+                if now >= next_maintenance:
+                    # 先推进下次维护时间：维护失败时也退避一个周期，避免立即重试形成忙循环
+                    next_maintenance = now + self._check_interval
+                    logger.debug("执行定时维护...")
+                    await self._run_periodic_maintenance()
 
-                # 遍历所有群组，筛选本轮需要检测的群
-                groups_to_process: List[str] = []
-                for group_id in self.message_buffer.get_group_ids_snapshot():
-                    lock = await self.message_buffer.get_or_create_lock(group_id)
-                    async with lock:
-                        total_messages = self.message_buffer.get_total_messages(group_id)
-
-                    # 如果有消息，则进行检测
-                    if total_messages > 0:
-                        trigger_mode = self._get_config("trigger_mode", "hybrid")
-                        last_check = self.message_buffer.get_check_time(group_id)
-                        time_elapsed = time.time() - last_check
-
-                        if trigger_mode == "time_only":
-                            if time_elapsed >= check_interval:
-                                logger.info(f"群 {group_id} 定时触发检测（消息数: {total_messages}）")
-                                groups_to_process.append(group_id)
-                        else:
-                            if await self._should_trigger_check(group_id, total_messages):
-                                logger.info(f"群 {group_id} 定时轮询触发检测（消息数: {total_messages}）")
-                                groups_to_process.append(group_id)
+                groups_to_process = await self._pop_due_groups(time.time())
 
                 # 并发处理，避免单个群处理慢导致全局队头阻塞
                 if groups_to_process:
@@ -1017,18 +1188,6 @@ class SpeechCensorshipPlugin(Star):
                         if isinstance(result, Exception):
                             logger.error(f"群 {group_id} 定时并发检测失败: {result}", exc_info=True)
 
-                # 清理过期消息
-                message_buffer_max_age = int(self._get_config("message_buffer_max_age", 3600))
-                self.message_buffer.cleanup_old_messages(max_age_seconds=message_buffer_max_age)
-
-                # 清理过期违规记录
-                if self.violation_manager:
-                    violation_records_expire_days = int(self._get_config("violation_records_expire_days", 7))
-                    await self.violation_manager.cleanup_expired_records(max_age_days=violation_records_expire_days)
-
-                # 清理已清空的群组的event缓存（防止内存泄漏）
-                await self._cleanup_stale_events()
-
             except asyncio.CancelledError:
                 logger.info("定时检测任务被取消")
                 break
@@ -1061,24 +1220,29 @@ class SpeechCensorshipPlugin(Star):
 
     async def _process_group_messages(self, group_id: str):
         """处理群组的累积消息（修复竞态条件和防止消息丢失）"""
+        # 快速路径：缓冲区为空时直接返回，不进入处理状态机也不争用群组锁
+        if self.message_buffer.get_total_messages(group_id) == 0:
+            return
+
         # 第0阶段：尝试获取处理锁，防止重复处理
         if not await self._try_acquire_processing_lock(group_id):
             return
 
         try:
             lock = await self.message_buffer.get_or_create_lock(group_id)
-            trigger_mode = self._get_config("trigger_mode", "hybrid")
-            recent_limit = int(self._get_config("recent_message_limit", 50)) if trigger_mode == "strict_hybrid" else 0
+            recent_limit = self._get_recent_limit()
 
-            # 在锁保护下原子执行：深拷贝快照 + 立即清空缓冲区
+            # 第1阶段：在锁保护下原子执行：移出快照 + 清空缓冲区 + 更新检测时间
+            # 锁仅覆盖这一步，LLM 调用期间新消息、定时检测和管理员命令都不会被阻塞
             async with lock:
                 try:
+                    total_count = self.message_buffer.get_total_messages(group_id)
                     messages_dict = self.message_buffer.snapshot_and_clear(group_id)
 
                     if not messages_dict:
                         return
 
-                    total_count = sum(len(msgs) for msgs in messages_dict.values())
+                    self.message_buffer.update_check_time(group_id)
                     logger.info(f"群 {group_id} 获取消息快照（{total_count} 条），即将进行 LLM 分析...")
                 except Exception as e:
                     logger.error(f"缓冲区快照获取失败: {e}", exc_info=True)
@@ -1141,8 +1305,6 @@ class SpeechCensorshipPlugin(Star):
                             self.message_buffer.restore_snapshot(group_id, messages_dict, recent_limit)
                         logger.warning(f"群 {group_id} 分析失败且不重试，消息已回灌到缓冲区")
 
-                self.message_buffer.update_check_time(group_id)
-
             except Exception as e:
                 async with lock:
                     self.message_buffer.restore_snapshot(group_id, messages_dict, recent_limit)
@@ -1150,39 +1312,9 @@ class SpeechCensorshipPlugin(Star):
                 return
 
             try:
-                records_updated = False
-
                 if violations:
                     logger.info(f"检测到 {len(violations)} 个违规用户")
-
-                    # 对每个违规用户执行禁言
-                    for violation in violations:
-                        user_id = violation.get("user_id")
-                        reason = violation.get("reason", "违规内容")
-
-                        if not user_id:
-                            continue
-
-                        # 应用防误杀护栏
-                        if not self.ban_executor.validate_and_should_ban(
-                            user_id, messages_dict, reason
-                        ):
-                            continue
-
-                        # 检查重复违规冷却
-                        if self.violation_manager and await self.violation_manager.check_repeated_violation_async(group_id, user_id):
-                            continue
-
-                        # 执行禁言
-                        event = await self._get_latest_event(group_id)
-                        if event and await self.ban_executor.ban_user(event, group_id, user_id, reason):
-                            # 记录违规（仅在禁言成功时）
-                            if self.violation_manager:
-                                await self.violation_manager.record_violation_async(group_id, user_id)
-                                records_updated = True
-
-                    if records_updated and self.violation_manager:
-                        await self.violation_manager.save_records()
+                    await self._execute_bans(group_id, violations, messages_dict)
                 else:
                     logger.info(f"群 {group_id} 未检测到违规内容")
 
@@ -1193,6 +1325,12 @@ class SpeechCensorshipPlugin(Star):
             # 无论成功失败，都要释放处理锁
             await self._release_processing_lock(group_id)
 
+            # 处理期间新到或回灌的消息需要继续参与定时检测
+            if self.message_buffer.get_total_messages(group_id) > 0:
+                self._schedule_group_check(group_id)
+
+            await self._recheck_deferred_trigger(group_id)
+
     async def terminate(self):
         """插件卸载时取消定时任务并保存数据"""
         if self.timer_task:
@@ -1203,6 +1341,11 @@ class SpeechCensorshipPlugin(Star):
                 pass
             logger.info("定时检测任务已停止")
 
+        for task in list(self._background_tasks):
+            task.cancel()
+        if self._background_tasks:
+            await asyncio.gather(*self._background_tasks, return_exceptions=True)
+
         # 保存所有违规记录到持久化存储
         if self.violation_manager:
             try:
@@ -1,10 +1,19 @@
 """消息缓冲管理模块 - 负责消息的累积、同步和状态管理"""
 
 import asyncio
-import copy
 import time
-from collections import defaultdict
-from typing import Dict, List
+from collections import defaultdict, deque
+from operator import itemgetter
+from typing import Deque, Dict, List, Set, Tuple
+
+
+def _timestamp_of(message: Dict) -> float:
+    """规范化消息 timestamp（异常值按 0 处理，防止比较异常）"""
+    raw_timestamp = message.get("timestamp", 0)
+    try:
+        return float(raw_timestamp)
+    except (TypeError, ValueError):
+        return 0.0
 
 
 class MessageBuffer:
@@ -18,10 +27,23 @@ class MessageBuffer:
     """
 
     def __init__(self):
-        # 消息缓冲区：{group_id: {user_id: [{"message": str, "timestamp": int, "user_name": str}]}}
-        self.buffer: Dict[str, Dict[str, List[Dict]]] = defaultdict(
-            lambda: defaultdict(list)
-        )
+        # 消息缓冲区（扁平布局，追加时只需一次哈希查找）：
+        # {(group_id, user_id): [{"message": str, "timestamp": int, "user_name": str}]}
+        self.buffer: Dict[Tuple[str, str], List[Dict]] = defaultdict(list)
+
+        # 群组 -> 有缓冲消息的用户集合（按群访问 buffer 的二级索引）
+        self._group_users: Dict[str, Set[str]] = defaultdict(set)
+
+        # 每个群组的到达顺序索引：deque[(user_id, message)]
+        # 与 buffer 中各用户列表保持一致（同一用户的子序列顺序相同），
+        # 用于 O(被淘汰条数) 的最近窗口裁剪，无需扁平化排序
+        self._group_order: Dict[str, Deque[Tuple[str, Dict]]] = defaultdict(deque)
+
+        # 每个群组的缓冲消息计数（随追加/清空/清理/裁剪同步维护，读取为 O(1)）
+        self._group_counts: Dict[str, int] = defaultdict(int)
+
+        # 每个群组缓冲消息的最早时间戳（追加时取最小值；裁剪后可能偏小，仅用于跳过无需清理的群）
+        self._group_oldest_ts: Dict[str, float] = {}
 
         # 每个群组的最后检测时间
         self.last_check_time: Dict[str, float] = {}
@@ -29,16 +51,16 @@ class MessageBuffer:
         # 每个群组的并发锁（防止竞争）
         self.group_locks: Dict[str, asyncio.Lock] = {}
 
-        # 保护 group_locks 字典本身的锁（修复非原子性竞态）
-        self._locks_dict_lock = asyncio.Lock()
-
     async def get_or_create_lock(self, group_id: str) -> asyncio.Lock:
-        """获取或创建群组的锁（原子操作，P0修复：移除快速路径避免竞态）"""
-        # P0 修复：所有操作都在锁内进行，避免快速路径的竞态条件
-        async with self._locks_dict_lock:
-            if group_id not in self.group_locks:
-                self.group_locks[group_id] = asyncio.Lock()
-            return self.group_locks[group_id]
+        """获取或创建群组的锁（原子操作）
+
+        查找与创建之间没有 await，在单线程事件循环中天然原子，
+        不会出现两个协程拿到不同锁实例的竞态，因此无需再额外加一把字典锁。
+        """
+        lock = self.group_locks.get(group_id)
+        if lock is None:
+            lock = self.group_locks[group_id] = asyncio.Lock()
+        return lock
 
     def _cleanup_empty_lock(self, group_id: str):
         """保留锁引用，避免等待中的协程拿到不同锁实例导致互斥失效。"""
@@ -46,7 +68,15 @@ class MessageBuffer:
 
     def append_message(self, group_id: str, user_id: str, message: dict):
         """向缓冲区添加消息（调用方应在协程上下文中确保顺序访问）"""
-        self.buffer[group_id][user_id].append(message)
+        self.buffer[(group_id, user_id)].append(message)
+        self._group_users[group_id].add(user_id)
+        self._group_order[group_id].append((user_id, message))
+        self._group_counts[group_id] += 1
+
+        timestamp_value = _timestamp_of(message)
+        oldest = self._group_oldest_ts.get(group_id)
+        if oldest is None or timestamp_value < oldest:
+            self._group_oldest_ts[group_id] = timestamp_value
 
     async def append_message_with_lock(self, group_id: str, user_id: str, message: dict):
         """在群组锁保护下添加消息"""
@@ -56,29 +86,40 @@ class MessageBuffer:
 
     def get_total_messages(self, group_id: str) -> int:
         """获取群组的总消息数"""
-        if group_id not in self.buffer:
-            return 0
-        return sum(len(msgs) for msgs in self.buffer[group_id].values())
+        return self._group_counts.get(group_id, 0)
+
+    def get_all_total_messages(self) -> int:
+        """获取所有群组的缓冲消息总数"""
+        return sum(self._group_counts.values())
+
+    def get_group_count(self) -> int:
+        """获取缓冲区中的群组数"""
+        return len(self._group_users)
 
     def get_group_ids_snapshot(self) -> List[str]:
         """获取群组ID快照，避免迭代期间字典被并发修改"""
-        return list(self.buffer.keys())
+        return list(self._group_users.keys())
 
     def snapshot_and_clear(self, group_id: str) -> Dict[str, List[Dict]]:
         """原子操作：创建快照并清空缓冲区
 
         这是解决竞态条件的关键：在锁保护下，
-        创建消息副本并立即清空缓冲区，
-        这样新消息可以在 LLM 处理期间继续写入新的缓冲区。
+        将各用户的消息列表整体移出缓冲区（不复制），
+        这样新消息可以在 LLM 处理期间继续写入新的列表，不会与快照共享同一对象。
+        返回的快照归调用方所有，缓冲区不再引用其中的消息。
         """
-        if group_id not in self.buffer:
+        if group_id not in self._group_users:
             return {}
 
-        # 深拷贝快照（包含消息中可能存在的嵌套结构）
-        snapshot: Dict[str, List[Dict]] = copy.deepcopy(dict(self.buffer[group_id]))
-
-        # 立即清空缓冲区，允许新消息写入
-        self.buffer[group_id].clear()
+        # 移出而非拷贝：每个用户一次字典弹出，无需逐条复制消息
+        group_users = self._group_users[group_id]
+        snapshot: Dict[str, List[Dict]] = {
+            user_id: self.buffer.pop((group_id, user_id)) for user_id in group_users
+        }
+        group_users.clear()
+        self._group_order.pop(group_id, None)
+        self._group_oldest_ts.pop(group_id, None)
+        self._group_counts[group_id] = 0
 
         return snapshot
 
@@ -91,62 +132,71 @@ class MessageBuffer:
         current_time = time.time()
         cutoff_time = current_time - max_age_seconds
 
-        for group_id in list(self.buffer.keys()):
-            for user_id in list(self.buffer[group_id].keys()):
-                # 过滤掉旧消息
-                valid_messages = []
-                for msg in self.buffer[group_id][user_id]:
-                    raw_timestamp = msg.get("timestamp", 0)
-                    try:
-                        timestamp_value = float(raw_timestamp)
-                    except (TypeError, ValueError):
-                        timestamp_value = 0.0
+        for group_id in list(self._group_users.keys()):
+            # 最早消息都未过期的群直接跳过，无需遍历其消息
+            if self._group_oldest_ts.get(group_id, 0) >= cutoff_time:
+                continue
+
+            # 消息按到达顺序（即时间顺序）入队：从队首弹出已过期消息，
+            # 开销只与过期条数相关；同一用户被弹出的消息一定是其列表前缀
+            order = self._group_order[group_id]
+            expired_total = 0
+            expired_per_user: Dict[str, int] = defaultdict(int)
+            while order and _timestamp_of(order[0][1]) < cutoff_time:
+                user_id = order.popleft()[0]
+                expired_per_user[user_id] += 1
+                expired_total += 1
+
+            # 原地删除各用户列表的过期前缀（不重新分配列表）
+            group_users = self._group_users[group_id]
+            for user_id, expired in expired_per_user.items():
+                key = (group_id, user_id)
+                del self.buffer[key][:expired]
 
-                    if timestamp_value >= cutoff_time:
-                        valid_messages.append(msg)
+                # 如果该用户没有消息了，删除该用户
+                if not self.buffer[key]:
+                    del self.buffer[key]
+                    group_users.discard(user_id)
 
-                self.buffer[group_id][user_id] = valid_messages
+            if expired_total:
+                self._group_counts[group_id] -= expired_total
 
-                # 如果该用户没有消息了，删除该用户
-                if not self.buffer[group_id][user_id]:
-                    del self.buffer[group_id][user_id]
+            if order:
+                self._group_oldest_ts[group_id] = _timestamp_of(order[0][1])
 
             # 如果该群没有消息了，删除该群并清理其锁
-            if not self.buffer[group_id]:
-                del self.buffer[group_id]
+            if not group_users:
+                del self._group_users[group_id]
+                self._group_counts.pop(group_id, None)
+                self._group_order.pop(group_id, None)
+                self._group_oldest_ts.pop(group_id, None)
                 self._cleanup_empty_lock(group_id)
                 self.last_check_time.pop(group_id, None)
 
     def trim_recent_messages(self, group_id: str, limit: int):
         """仅保留某群最近 N 条消息（跨用户全局窗口）。limit<=0 时不限制。"""
-        if limit <= 0 or group_id not in self.buffer:
+        if limit <= 0 or group_id not in self._group_users:
             return
 
-        # 统计总消息数
-        total_count = sum(len(msgs) for msgs in self.buffer[group_id].values())
-        if total_count <= limit:
+        overflow = self._group_counts.get(group_id, 0) - limit
+        if overflow <= 0:
             return
 
-        # 扁平化并排序（修复：规范化 timestamp 类型，防止比较异常）
-        flattened = []
-        for uid, messages in self.buffer[group_id].items():
-            for msg in messages:
-                raw_timestamp = msg.get("timestamp", 0)
-                try:
-                    timestamp_value = float(raw_timestamp)
-                except (TypeError, ValueError):
-                    timestamp_value = 0.0
-                flattened.append((timestamp_value, uid, msg))
+        # 从到达顺序队首淘汰最旧消息；同一用户被淘汰的一定是其列表前缀
+        order = self._group_order[group_id]
+        evicted_per_user: Dict[str, int] = defaultdict(int)
+        for _ in range(overflow):
+            uid = order.popleft()[0]
+            evicted_per_user[uid] += 1
 
-        flattened.sort(key=lambda item: item[0])
-        recent_items = flattened[-limit:]
+        for uid, evicted in evicted_per_user.items():
+            key = (group_id, uid)
+            del self.buffer[key][:evicted]
+            if not self.buffer[key]:
+                del self.buffer[key]
+                self._group_users[group_id].discard(uid)
 
-        # 重建缓冲区
-        rebuilt = defaultdict(list)
-        for _, uid, msg in recent_items:
-            rebuilt[uid].append(msg)
-
-        self.buffer[group_id] = rebuilt
+        self._group_counts[group_id] = limit
 
     def restore_snapshot(self, group_id: str, snapshot: Dict[str, List[Dict]], limit: int = 0):
         """将处理失败的快照回灌到缓冲区。
@@ -157,13 +207,34 @@ class MessageBuffer:
         if not snapshot:
             return
 
-        if group_id not in self.buffer:
-            self.buffer[group_id] = defaultdict(list)
-
-        # 回灌时按“旧消息在前，新消息在后”合并，避免时间顺序错乱
-        for user_id, old_messages in snapshot.items():
-            current_messages = self.buffer[group_id].get(user_id, [])
-            self.buffer[group_id][user_id] = list(old_messages) + list(current_messages)
+        # 回灌时按“旧消息在前，新消息在后”合并，避免时间顺序错乱；
+        # 快照内部按时间稳定排序，再由合并后的顺序重建各用户列表，保持两者一致
+        # 预先计算排序键，用 C 实现的 itemgetter 代替逐次调用的 lambda
+        keyed = [
+            (_timestamp_of(msg), user_id, msg)
+            for user_id, old_messages in snapshot.items()
+            for msg in old_messages
+        ]
+        keyed.sort(key=itemgetter(0))
+        restored = [(user_id, msg) for _, user_id, msg in keyed]
+        restored.extend(self._group_order.get(group_id, ()))
+
+        if keyed:
+            oldest = self._group_oldest_ts.get(group_id)
+            if oldest is None or keyed[0][0] < oldest:
+                self._group_oldest_ts[group_id] = keyed[0][0]
+
+        for user_id in self._group_users.get(group_id, ()):
+            del self.buffer[(group_id, user_id)]
+
+        group_users = self._group_users[group_id]
+        group_users.clear()
+        for user_id, msg in restored:
+            self.buffer[(group_id, user_id)].append(msg)
+            group_users.add(user_id)
+
+        self._group_order[group_id] = deque(restored)
+        self._group_counts[group_id] = len(restored)
 
         if limit > 0:
             self.trim_recent_messages(group_id, limit)
@@ -217,22 +217,29 @@ class ViolationManager:
             return self.check_repeated_violation(group_id, user_id, cooldown_seconds)
 
     async def cleanup_expired_records(self, max_age_days: int = 7):
-        """清理超过 max_age_days 天的违规记录
+        """清理超过 max_age_days 天未再违规的记录
+
+        按最后一次违规时间（last_time）判断过期，而不是创建时间：
+        持续违规的用户不会因记录创建较早而在冷却期内被提前清除，
+        长期不再违规的用户记录则会被及时回收，内存占用只与近期活跃违规用户数相关。
 
         Args:
             max_age_days: 记录最大保留天数（默认 7 天）
         """
         current_time = time.time()
-        max_age_seconds = max_age_days * 24 * 3600
+        # 保留时长至少覆盖冷却期，避免冷却护栏失效
+        max_age_seconds = max(max_age_days * 24 * 3600, self.cooldown_seconds)
+        cutoff_time = current_time - max_age_seconds
 
         expired_count = 0
         async with self._records_lock:
             for group_id in list(self.records.keys()):
-                for user_id in list(self.records[group_id].keys()):
-                    record = self.records[group_id][user_id]
-                    created_time = record.get("created_time", 0)
-                    if created_time < (current_time - max_age_seconds):
-                        del self.records[group_id][user_id]
+                users = self.records[group_id]
+                for user_id in list(users.keys()):
+                    record = users[user_id]
+                    last_active = max(record.get("last_time", 0), record.get("created_time", 0))
+                    if last_active < cutoff_time:
+                        del users[user_id]
                         expired_count += 1
 
                 # 清理空的群组